@@ -1,11 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-try:
-    from functools import reduce  # noqa
-except Exception:
-    pass
-
 try:
     from .tornado_handler import TornadoHandler  # noqa
 except ImportError:
@@ -5,8 +5,6 @@ import os
 import platform
 import sys
 
-import six
-
 from .security import safe_dict
 
 
@@ -37,7 +35,7 @@ class EnvironmentDump(object):
 
     def run(self):
         data = {}
-        for (name, func) in six.iteritems(self.functions):
+        for (name, func) in self.functions.items():
             data[name] = func()
 
         return json.dumps(data, default=str), 200, {'Content-Type': 'application/json'}
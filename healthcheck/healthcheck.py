@@ -2,19 +2,51 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import itertools
 import socket
-
-import six
+import threading
 import time
+from concurrent.futures import Future, as_completed, TimeoutError as FuturesTimeoutError
+from functools import partial
+from heapq import heappop, heappush
+from types import MappingProxyType
 
-from .timeout import timeout
+from .timeout import timeout, TimeoutError
 
 logger = logging.getLogger(__name__)
 
+
+def _json_dumps(data):
+    return json.dumps(data).encode('utf-8')
+
+
 try:
-    from functools import reduce
-except Exception:
-    pass
+    import orjson
+
+    def _dumps(data):
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # orjson is stricter than json (e.g. non str keys), keep json behaviour for those
+            return _json_dumps(data)
+except ImportError:
+    _dumps = _json_dumps
+
+
+# static part of the json handlers envelope, copied on each response
+_SUCCESS_TEMPLATE = {'hostname': socket.gethostname(), 'status': 'success'}
+_FAILED_TEMPLATE = {'hostname': _SUCCESS_TEMPLATE['hostname'], 'status': 'failure'}
+
+
+# shared by runs without custom sections
+_NO_SECTIONS = MappingProxyType({})
+
+
+def invalidate_hostname_cache():
+    """Refresh the hostname reported by the json handlers, e.g. after the container hostname changes."""
+    hostname = socket.gethostname()
+    _SUCCESS_TEMPLATE['hostname'] = hostname
+    _FAILED_TEMPLATE['hostname'] = hostname
 
 
 def basic_exception_handler(_, e):
@@ -22,29 +54,19 @@ def basic_exception_handler(_, e):
 
 
 def json_success_handler(results, *args, **kw):
-    data = {
-        'hostname': socket.gethostname(),
-        'status': 'success',
-        'timestamp': time.time(),
-        'results': results,
-    }
-    [data.update({k: v}) for k, v in kw.items()]
-    return json.dumps(data)
+    data = _SUCCESS_TEMPLATE.copy()
+    data['timestamp'] = time.time()
+    data['results'] = results
+    data.update(kw)
+    return _dumps(data)
 
 
 def json_failed_handler(results, *args, **kw):
-    data = {
-        'hostname': socket.gethostname(),
-        'status': 'failure',
-        'timestamp': time.time(),
-        'results': results,
-    }
-    [data.update({k: v}) for k, v in kw.items()]
-    return json.dumps(data)
-
-
-def check_reduce(passed, result):
-    return passed and result.get('passed')
+    data = _FAILED_TEMPLATE.copy()
+    data['timestamp'] = time.time()
+    data['results'] = results
+    data.update(kw)
+    return _dumps(data)
 
 
 class HealthCheck(object):
@@ -54,16 +76,20 @@ class HealthCheck(object):
                  failed_handler=json_failed_handler, failed_ttl=9,
                  error_timeout=0,
                  exception_handler=basic_exception_handler, checkers=None,
-                 **kwargs):
+                 fail_fast=False, **kwargs):
         self.cache = dict()
+        # (expires, sequence, checker) of the cached results, soonest first,
+        # the sequence keeps checkers, which aren't orderable, out of comparisons
+        self._expiry_heap = []
+        self._expiry_sequence = itertools.count()
 
         self.success_status = success_status
-        self.success_headers = success_headers or {'Content-Type': 'application/json'}
+        self.success_headers = success_headers or {'Content-Type': 'application/json; charset=utf-8'}
         self.success_handler = success_handler
         self.success_ttl = float(success_ttl or 0)
 
         self.failed_status = failed_status
-        self.failed_headers = failed_headers or {'Content-Type': 'application/json'}
+        self.failed_headers = failed_headers or {'Content-Type': 'application/json; charset=utf-8'}
         self.failed_handler = failed_handler
         self.failed_ttl = float(failed_ttl or 0)
 
@@ -71,11 +97,22 @@ class HealthCheck(object):
 
         self.exception_handler = exception_handler
 
-        self.checkers = checkers or []
+        self.fail_fast = fail_fast
+
+        self._cache_lock = threading.Lock()
+
+        # shared by all runs, checkers still running from a previous run are not submitted again
+        self._in_flight = dict()
+        self._in_flight_lock = threading.Lock()
+
+        # own copy, so instances built from the same iterable don't share registrations
+        self.checkers = list(checkers or [])
 
         self.functions = dict()
         # ads custom_sections on signature
-        [self.add_section(k, v) for k, v in kwargs.items() if k not in self.functions]
+        for name, func in kwargs.items():
+            if name not in self.functions:
+                self.add_section(name, func)
 
     def add_section(self, name, func):
         if name in self.functions:
@@ -86,24 +123,46 @@ class HealthCheck(object):
         self.checkers.append(func)
 
     def run(self, check=None):
-        results = []
-        filtered = [c for c in self.checkers if check is None or c.__name__ == check]
+        # snapshot, so checkers added while running don't change this run
+        if check is None:
+            filtered = tuple(self.checkers)
+        else:
+            filtered = tuple(c for c in self.checkers if c.__name__ == check)
+
+        self._evict_expired(time.time())
+
+        collected = dict()
+        misses = []
         for checker in filtered:
-            if checker in self.cache and self.cache[checker].get('expires') >= time.time():
-                result = self.cache[checker]
+            entry = self.cache.get(checker)
+            if entry is not None:
+                collected[checker] = entry
             else:
-                result = self.run_check(checker)
-                self.cache[checker] = result
-            results.append(result)
+                misses.append(checker)
+
+        if len(misses) == 1 and not self.error_timeout:
+            collected[misses[0]] = self.run_check(misses[0])
+        elif misses:
+            collected.update(self.run_checks(misses))
 
-        custom_section = dict()
-        for (name, func) in six.iteritems(self.functions):
-            try:
-                custom_section[name] = func() if callable(func) else func
-            except Exception:
-                pass
+        with self._cache_lock:
+            for checker in misses:
+                if checker in collected:
+                    self._cache_result(checker, collected[checker])
 
-        passed = reduce(check_reduce, results, True)
+        # with fail_fast, checkers skipped after the first failure are left out
+        results = [collected[checker] for checker in filtered if checker in collected]
+
+        custom_section = _NO_SECTIONS
+        if self.functions:
+            custom_section = dict()
+            for (name, func) in self.functions.items():
+                try:
+                    custom_section[name] = func() if callable(func) else func
+                except Exception:
+                    pass
+
+        passed = all(result.get('passed') for result in results)
 
         if passed:
             message = "OK"
@@ -118,11 +177,92 @@ class HealthCheck(object):
 
             return message, self.failed_status, self.failed_headers
 
-    def run_check(self, checker):
-        start_time = time.time()
+    def invalidate(self, check=None):
+        """Drop the cached results of the checkers named ``check``, or all of them."""
+        with self._cache_lock:
+            if check is None:
+                self.cache.clear()
+                del self._expiry_heap[:]
+            else:
+                for checker in [c for c in self.cache if c.__name__ == check]:
+                    del self.cache[checker]
+
+    def _cache_result(self, checker, result):
+        # callers hold _cache_lock, a result may be stored by both run() and _finished()
+        if self.cache.get(checker) is not result:
+            self.cache[checker] = result
+            heappush(self._expiry_heap, (result['expires'], next(self._expiry_sequence), checker))
+
+    def _evict_expired(self, now):
+        with self._cache_lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                expires, _, checker = heappop(heap)
+                entry = self.cache.get(checker)
+                # the checker may have been cached again since, with a later expiry
+                if entry is not None and entry['expires'] == expires:
+                    del self.cache[checker]
+
+    def run_checks(self, checkers):
+        """Run the given checkers concurrently, returning a dict of results keyed by checker.
+
+        Checkers still running once ``error_timeout`` expires are reported as failed.
+        With ``fail_fast`` the remaining checkers are abandoned as soon as one fails.
+        """
+        results = dict()
+        with self._in_flight_lock:
+            futures = dict((self._submit(c), c) for c in checkers)
+        try:
+            for future in as_completed(futures, timeout=self.error_timeout or None):
+                result = results[futures[future]] = future.result()
+                if self.fail_fast and not result['passed']:
+                    # abandoned checkers keep running, their results are cached once they finish
+                    break
+        except FuturesTimeoutError:
+            # futures may be shared with other runs, so they are left running
+            for checker in futures.values():
+                if checker not in results:
+                    passed, output = self.exception_handler(checker, TimeoutError("Timeout error!"))
+                    results[checker] = self._make_result(checker, passed, output, float(self.error_timeout))
+        return results
+
+    def _submit(self, checker):
+        future = self._in_flight.get(checker)
+        if future is None or future.done():
+            future = self._in_flight[checker] = Future()
+            future.add_done_callback(partial(self._finished, checker))
+            # a daemon thread per checker, so checkers abandoned after the deadline
+            # can't keep the interpreter from exiting
+            thread = threading.Thread(target=self._run_future, args=(checker, future),
+                                      name='healthcheck-{}'.format(checker.__name__))
+            thread.daemon = True
+            thread.start()
+        return future
+
+    def _run_future(self, checker, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            # SIGALRM can't be armed outside the main thread, the run_checks deadline replaces it
+            future.set_result(self.run_check(checker, False))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _finished(self, checker, future):
+        with self._in_flight_lock:
+            if self._in_flight.get(checker) is future:
+                del self._in_flight[checker]
+        if future.cancelled() or future.exception() is not None:
+            return
+        # results of checkers abandoned by fail_fast or the deadline are kept for the next runs
+        with self._cache_lock:
+            self._cache_result(checker, future.result())
+
+    def run_check(self, checker, use_alarm=True):
+        start_time = time.monotonic_ns()
 
         try:
-            if self.error_timeout > 0:
+            if use_alarm and self.error_timeout > 0:
                 passed, output = timeout(self.error_timeout, "Timeout error!")(checker)()
             else:
                 passed, output = checker()
@@ -130,11 +270,12 @@ class HealthCheck(object):
             logger.exception(e)
             passed, output = self.exception_handler(checker, e)
 
-        end_time = time.time()
-        elapsed_time = end_time - start_time
         # Reduce to 6 decimal points to have consistency with timestamp
-        elapsed_time = float('{:.6f}'.format(elapsed_time))
+        elapsed_time = round((time.monotonic_ns() - start_time) / 1e9, 6)
+
+        return self._make_result(checker, passed, output, elapsed_time)
 
+    def _make_result(self, checker, passed, output, elapsed_time):
         if not passed:
             msg = 'Health check "{}" failed with output "{}"'.format(checker.__name__, output)
             logger.error(msg)
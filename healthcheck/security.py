@@ -1,7 +1,4 @@
-try:
-    from collections.abc import Mapping  # only works on python 3.3+
-except ImportError:
-    from collections import Mapping
+from collections.abc import Mapping
 
 
 def safe_dict(dictionary, blacklist=('key', 'token', 'pass'), max_deep=5):
@@ -24,13 +24,13 @@ setup(
     include_package_data=True,
     license="MIT",
     platforms="any",
-    install_requires=["six"],
+    python_requires=">=3.7",
+    extras_require={"orjson": ["orjson"]},
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Environment :: Web Environment",
         "Framework :: Flask",
         # "Framework :: Tornado",
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
     ]
 )
@@ -6,10 +6,7 @@ import unittest
 
 from healthcheck import EnvironmentDump
 
-try:
-    from collections.abc import Mapping  # only works on python 3.3+
-except ImportError:
-    from collections import Mapping
+from collections.abc import Mapping
 
 
 class BasicEnvironmentDumpTest(unittest.TestCase):
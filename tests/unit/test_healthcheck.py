@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import json
+import os
+import subprocess
+import sys
+import threading
+import time
 import unittest
 
+from unittest import mock
+
 from healthcheck import HealthCheck
+from healthcheck.healthcheck import invalidate_hostname_cache
 
 
 class BasicHealthCheckTest(unittest.TestCase):
@@ -22,6 +30,15 @@ class BasicHealthCheckTest(unittest.TestCase):
         message, status, headers = HealthCheck().run()
         self.assertEqual(200, status)
 
+    def test_checkers_should_be_instance_scoped(self):
+        checkers = (self.check_that_works,)
+        hc = HealthCheck(checkers=checkers)
+        other = HealthCheck(checkers=checkers)
+        hc.add_check(self.check_throws_exception)
+        message, status, headers = other.run()
+        self.assertEqual(200, status)
+        self.assertEqual(1, len(json.loads(message)["results"]))
+
     def test_failing_check(self):
         hc = HealthCheck(checkers=[self.check_throws_exception])
         message, status, headers = hc.run()
@@ -33,9 +50,20 @@ class BasicHealthCheckTest(unittest.TestCase):
         hc = HealthCheck(checkers=[self.check_that_works])
         message, status, headers = hc.run()
         self.assertEqual(200, status)
+        self.assertIsInstance(message, bytes)
         jr = json.loads(message)
         self.assertEqual("success", jr["status"])
 
+    def test_hostname_cache_invalidation(self):
+        hc = HealthCheck(checkers=[self.check_that_works])
+        with mock.patch('socket.gethostname', return_value='new-hostname'):
+            invalidate_hostname_cache()
+        try:
+            message, status, headers = hc.run()
+            self.assertEqual("new-hostname", json.loads(message)["hostname"])
+        finally:
+            invalidate_hostname_cache()
+
     def test_custom_section_function_success_check(self):
         hc = HealthCheck(checkers=[self.check_that_works])
         hc.add_section("custom_section", lambda: "My custom section")
@@ -96,12 +124,109 @@ class BasicHealthCheckTest(unittest.TestCase):
         jr = json.loads(message)
         self.assertEqual("My custom section", jr["custom_section"])
 
+    def test_custom_section_non_string_keys_success_check(self):
+        hc = HealthCheck(checkers=[self.check_that_works], custom_section={1: "one"})
+        message, status, headers = hc.run()
+        self.assertEqual(200, status)
+        jr = json.loads(message)
+        self.assertEqual({"1": "one"}, jr["custom_section"])
+
     def test_custom_section_prevent_duplication(self):
         hc = HealthCheck(checkers=[self.check_that_works], custom_section="My custom section")
         self.assertRaises(Exception, 'The name "custom_section" is already taken.',
                           hc.add_section, "custom_section", "My custom section")
 
 
+class CacheHealthCheckTest(unittest.TestCase):
+
+    def test_results_should_be_cached_by_checker(self):
+        calls = []
+
+        def check_that_works():
+            calls.append(1)
+            return True, "it works"
+
+        hc = HealthCheck(checkers=[check_that_works])
+        hc.run()
+        hc.run()
+        self.assertEqual(1, len(calls))
+        self.assertIn(check_that_works, hc.cache)
+
+    def test_checkers_sharing_a_name_should_not_share_results(self):
+        class Dependency(object):
+            def __init__(self, ok):
+                self.ok = ok
+
+            def check(self):
+                return self.ok, "ok={}".format(self.ok)
+
+        hc = HealthCheck(checkers=[Dependency(True).check, Dependency(False).check])
+        hc.run()
+        message, status, headers = hc.run()
+        jr = json.loads(message)
+        self.assertEqual(["ok=True", "ok=False"], [r["output"] for r in jr["results"]])
+
+    def test_results_without_success_ttl_should_run_again(self):
+        calls = []
+
+        def check_that_works():
+            calls.append(1)
+            return True, "it works"
+
+        hc = HealthCheck(checkers=[check_that_works], success_ttl=None)
+        hc.run()
+        hc.run()
+        self.assertEqual(2, len(calls))
+
+    def test_results_without_failed_ttl_should_run_again(self):
+        calls = []
+
+        def fail_check():
+            calls.append(1)
+            return False, "FAIL"
+
+        hc = HealthCheck(checkers=[fail_check], failed_ttl=None)
+        hc.run()
+        hc.run()
+        self.assertEqual(2, len(calls))
+
+    def test_expired_results_should_run_again(self):
+        calls = []
+
+        def check_that_works():
+            calls.append(1)
+            return True, "it works"
+
+        hc = HealthCheck(checkers=[check_that_works], success_ttl=27)
+        hc.run()
+        with mock.patch('time.time', return_value=time.time() + 26):
+            hc.run()
+        self.assertEqual(1, len(calls))
+        with mock.patch('time.time', return_value=time.time() + 28):
+            hc.run()
+        self.assertEqual(2, len(calls))
+
+    def test_invalidated_results_should_run_again(self):
+        calls = []
+
+        def check_that_works():
+            calls.append(1)
+            return True, "it works"
+
+        def another_check():
+            calls.append(2)
+            return True, "it works"
+
+        hc = HealthCheck(checkers=[check_that_works, another_check])
+        hc.run()
+        hc.invalidate("check_that_works")
+        hc.run()
+        self.assertEqual(2, calls.count(1))
+        self.assertEqual(1, calls.count(2))
+        hc.invalidate()
+        self.assertEqual({}, hc.cache)
+
+
 class TimeoutHealthCheckTest(unittest.TestCase):
 
     def test_default_timeout_should_success_check(self):
@@ -128,6 +253,136 @@ class TimeoutHealthCheckTest(unittest.TestCase):
         jr = json.loads(message)
         self.assertEqual("failure", jr["status"])
 
+    def test_error_timeout_set_after_init_should_failing_check(self):
+        release = threading.Event()
+
+        def timeout_check():
+            release.wait()
+            return True, "released"
+
+        hc = HealthCheck(checkers=[timeout_check])
+        hc.error_timeout = 1
+        try:
+            message, status, headers = hc.run()
+        finally:
+            release.set()
+        self.assertEqual(500, status)
+        jr = json.loads(message)
+        self.assertEqual("Timeout error!", jr["results"][0]["output"])
+
+
+class ConcurrentHealthCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocked_check(self):
+        self.calls.append(1)
+        self.release.wait()
+        return True, "released"
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("condition not met")
+
+    @staticmethod
+    def check_that_works():
+        return True, "it works"
+
+    def test_checkers_should_run_concurrently(self):
+        # serial execution would leave the first checker alone at the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def check_one():
+            barrier.wait()
+            return True, "one"
+
+        def check_two():
+            barrier.wait()
+            return True, "two"
+
+        hc = HealthCheck(checkers=[check_one, check_two])
+        message, status, headers = hc.run()
+        self.assertEqual(200, status)
+        jr = json.loads(message)
+        self.assertEqual(["check_one", "check_two"], [r["checker"] for r in jr["results"]])
+
+    def test_error_timeout_should_fail_only_slow_checkers(self):
+        hc = HealthCheck(checkers=[self.blocked_check, self.check_that_works], error_timeout=1)
+        message, status, headers = hc.run()
+        self.assertEqual(500, status)
+        jr = json.loads(message)
+        self.assertEqual([False, True], [r["passed"] for r in jr["results"]])
+        self.assertEqual("Timeout error!", jr["results"][0]["output"])
+
+    def test_error_timeout_should_not_need_the_main_thread(self):
+        hc = HealthCheck(checkers=[self.blocked_check], error_timeout=1)
+        responses = []
+        worker = threading.Thread(target=lambda: responses.append(hc.run()))
+        worker.start()
+        worker.join()
+        message, status, headers = responses[0]
+        self.assertEqual(500, status)
+        self.assertEqual("Timeout error!", json.loads(message)["results"][0]["output"])
+
+    def test_timed_out_checkers_should_not_block_interpreter_exit(self):
+        script = (
+            "import threading\n"
+            "from healthcheck import HealthCheck\n"
+            "def hang():\n"
+            "    threading.Event().wait()\n"
+            "    return True, 'never'\n"
+            "def check_that_works():\n"
+            "    return True, 'it works'\n"
+            "print(HealthCheck(checkers=[hang, check_that_works], error_timeout=1).run()[1])\n"
+        )
+        cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=cwd, timeout=30)
+        self.assertEqual(b"500", output.strip())
+
+    def test_running_checkers_should_not_be_submitted_again(self):
+        hc = HealthCheck(checkers=[self.blocked_check], error_timeout=1, failed_ttl=None)
+        hc.run()
+        message, status, headers = hc.run()
+        self.assertEqual(500, status)
+        self.assertEqual(1, len(self.calls))
+
+    def test_fail_fast_should_not_wait_for_running_checkers(self):
+        def fail_check():
+            return False, "FAIL"
+
+        hc = HealthCheck(checkers=[self.blocked_check, fail_check], fail_fast=True, failed_ttl=None)
+        message, status, headers = hc.run()
+        self.assertEqual(500, status)
+        jr = json.loads(message)
+        self.assertEqual(["fail_check"], [r["checker"] for r in jr["results"]])
+        self.assertNotIn(self.blocked_check, hc.cache)
+
+        # the abandoned checker is still running, it must not be started again
+        hc.run()
+        self.assertEqual(1, len(self.calls))
+
+    def test_fail_fast_abandoned_results_should_be_cached(self):
+        def fail_check():
+            return False, "FAIL"
+
+        hc = HealthCheck(checkers=[self.blocked_check, fail_check], fail_fast=True, failed_ttl=None)
+        hc.run()
+        self.release.set()
+        self.wait_for(lambda: self.blocked_check in hc.cache)
+
+        message, status, headers = hc.run()
+        self.assertEqual(1, len(self.calls))
+        jr = json.loads(message)
+        self.assertEqual(["released", "FAIL"], [r["output"] for r in jr["results"]])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -34,6 +34,7 @@ class BasicHealthCheckTest(unittest.TestCase):
 
         jr = flask.json.loads(response.data)
         self.assertEqual("failure", jr["status"])
+        self.assertEqual("application/json; charset=utf-8", response.headers["Content-Type"])
 
 
 class BasicEnvironmentDumpTest(unittest.TestCase):